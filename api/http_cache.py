@@ -0,0 +1,85 @@
+import gzip
+import os
+from datetime import timezone
+from functools import wraps
+
+from dotenv import load_dotenv
+from flask import request, make_response
+
+from db.mongo import get_db
+from models.model_persistence import get_latest_version
+
+load_dotenv()
+
+# Segundos que el cliente puede reutilizar la respuesta antes de revalidar
+HTTP_CACHE_MAX_AGE = int(os.getenv('HTTP_CACHE_MAX_AGE', 60))
+
+# Compresión gzip negociada para respuestas grandes
+HTTP_GZIP = os.getenv('HTTP_GZIP', 'True') == 'True'
+GZIP_MIN_BYTES = int(os.getenv('GZIP_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', 6))
+
+
+def _apply_cache_headers(response, version):
+    # ETag débil: el mismo valor vale para la versión con y sin gzip
+    response.set_etag(version["version_id"], weak=True)
+    fecha = version.get("fecha_publicacion")
+    if fecha is not None:
+        response.last_modified = fecha.replace(tzinfo=fecha.tzinfo or timezone.utc)
+    response.cache_control.max_age = HTTP_CACHE_MAX_AGE
+    response.cache_control.must_revalidate = True
+    if HTTP_GZIP:
+        response.vary.add("Accept-Encoding")
+    return response
+
+
+def _not_modified(version):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(version["version_id"])
+    fecha = version.get("fecha_publicacion")
+    if request.if_modified_since and fecha is not None:
+        fecha = fecha.replace(tzinfo=fecha.tzinfo or timezone.utc, microsecond=0)
+        return fecha <= request.if_modified_since
+    return False
+
+
+def gzip_response(response):
+    """
+    Comprime el cuerpo con gzip si el cliente lo acepta y la respuesta es grande.
+    """
+    if (not HTTP_GZIP or response.status_code != 200 or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or "gzip" not in request.accept_encodings):
+        return response
+
+    body = response.get_data()
+    if len(body) < GZIP_MIN_BYTES:
+        return response
+
+    response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL))
+    response.headers["Content-Encoding"] = "gzip"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def versioned_cache(view):
+    """
+    Cachea por HTTP un endpoint cuyos datos solo cambian al publicarse una
+    nueva versión: ETag/Last-Modified de la versión actual, Cache-Control,
+    304 tras una consulta barata de la versión (sin ejecutar el endpoint) y gzip.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        db = get_db()
+        version = get_latest_version(db)
+        if not version or not version.get("version_id"):
+            return view(*args, **kwargs)
+
+        if _not_modified(version):
+            return _apply_cache_headers(make_response("", 304), version)
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200:
+            _apply_cache_headers(response, version)
+        return gzip_response(response)
+    return wrapper
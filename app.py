@@ -1,4 +1,4 @@
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, send_file
 from flask_cors import CORS
 import sys
 import os
@@ -10,8 +10,17 @@ from bson.objectid import ObjectId
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from dotenv import load_dotenv
-from rfm_analysis import run_segmentation, get_customer_segment
+from rfm_analysis import (
+    get_customer_segment, get_customer_segments,
+    count_new_sales, NEW_SALES_THRESHOLD, PARTITION_FIELD, PARTITION_FIELD_PATTERN, SEGMENTATION_ENGINES
+)
 from db.mongo import get_db
+from api.http_cache import versioned_cache
+from models.model_persistence import get_latest_version, get_latest_version_id, is_version_complete
+from models.segment_export import EXPORT_FORMATS, export_version
+from models.segment_query import QUERY_METRICS, DEFAULT_QUERY_LIMIT, query_segments, decode_cursor
+from scheduling.segmentation_scheduler import SCHEDULER_ENABLED, start_scheduler
+from worker.segmentation_worker import execute_segmentation
 
 # --- Configuración general ---
 load_dotenv()
@@ -27,6 +36,10 @@ logger = logging.getLogger('app')
 app = Flask(__name__)
 CORS(app)
 
+# --- Scheduler de reentrenamiento (un líder entre todos los workers) ---
+if SCHEDULER_ENABLED:
+    start_scheduler()
+
 # --- Endpoints ---
 
 @app.route("/")
@@ -56,14 +69,28 @@ def health_check():
 def trigger_segmentation():
     try:
         force = request.args.get('force', 'false').lower() == 'true'
-        logger.info("Ejecutando segmentación desde API")
-        result = run_segmentation(force=force)
+        partition_field = request.args.get('partition', PARTITION_FIELD)
+        if partition_field and not PARTITION_FIELD_PATTERN.match(partition_field):
+            return jsonify({"success": False, "message": f"Campo de partición inválido: {partition_field}"}), 400
+        if partition_field:
+            logger.info(f"Ejecutando segmentación por partición ({partition_field}) desde API")
+            result = execute_segmentation(partition_field=partition_field, force=force)
+        else:
+            logger.info("Ejecutando segmentación desde API")
+            warm_start = request.args.get('warm_start')
+            if warm_start is not None:
+                warm_start = warm_start.lower() == 'true'
+            engine = request.args.get('engine')
+            if engine and engine not in SEGMENTATION_ENGINES:
+                return jsonify({"success": False, "message": f"Motor de segmentación desconocido: {engine}"}), 400
+            result = execute_segmentation(force=force, warm_start=warm_start, engine=engine)
         return jsonify(result)
     except Exception as e:
         logger.error(f"Error al ejecutar segmentación: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route("/api/customer/segment/<customer_id>", methods=["GET"])
+@versioned_cache
 def api_get_customer_segment(customer_id):
     try:
         segment = get_customer_segment(customer_id)
@@ -75,7 +102,26 @@ def api_get_customer_segment(customer_id):
         logger.error(f"Error obteniendo segmento: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route("/api/customer/segments", methods=["POST"])
+def api_get_customer_segments():
+    """
+    Búsqueda masiva: recibe {"ids": [...]} (o directamente una lista) y devuelve
+    el segmento de cada cliente en la última versión y los ids no encontrados.
+    """
+    try:
+        payload = request.get_json(silent=True)
+        ids = payload.get("ids") if isinstance(payload, dict) else payload
+        if not isinstance(ids, list):
+            return jsonify({"success": False, "message": "Se esperaba una lista de ids"}), 400
+
+        segments, not_found = get_customer_segments(ids)
+        return jsonify({"success": True, "segments": segments, "not_found": not_found})
+    except Exception as e:
+        logger.error(f"Error obteniendo segmentos: {str(e)}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
 @app.route('/api/segmentation/customers', methods=['GET'])
+@versioned_cache
 def get_all_customer_segments():
     """
     Devuelve datos RFM y segmento por cliente SOLO de la última versión.
@@ -83,8 +129,8 @@ def get_all_customer_segments():
     try:
         db = get_db()
 
-        # Obtener el último version_id
-        last_segment = db.customer_segments.find_one(sort=[("fecha_calculo", -1)])
+        # Obtener el último version_id publicado
+        last_segment = get_latest_version(db)
         if not last_segment:
             return jsonify({"success": False, "message": "No hay datos de segmentación"}), 404
 
@@ -107,12 +153,133 @@ def get_all_customer_segments():
         logger.error(f"Error extrayendo datos de clientes: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route("/api/segmentation/export", methods=["GET"])
+def export_segmentation():
+    """
+    Exporta una versión de la segmentación como Parquet, Arrow IPC o CSV.
+    El formato se elige con ?format= o, si no se indica, por el header Accept.
+    Sin ?version_id= se exporta la última versión.
+    """
+    try:
+        fmt = request.args.get("format")
+        if not fmt:
+            mimetypes = {mimetype: name for name, (_, mimetype) in EXPORT_FORMATS.items()}
+            best = request.accept_mimetypes.best_match(list(mimetypes))
+            fmt = mimetypes.get(best, "parquet")
+        if fmt not in EXPORT_FORMATS:
+            return jsonify({"success": False, "message": f"Formato no soportado: {fmt}"}), 400
+
+        version_id = request.args.get("version_id")
+        if not version_id:
+            version_id = get_latest_version_id(get_db())
+            if not version_id:
+                return jsonify({"success": False, "message": "No hay datos de segmentación"}), 404
+        elif not ObjectId.is_valid(version_id):
+            return jsonify({"success": False, "message": "version_id inválido"}), 400
+
+        path = export_version(version_id, fmt)
+        if not path:
+            return jsonify({"success": False, "message": "Versión no encontrada"}), 404
+
+        extension, mimetype = EXPORT_FORMATS[fmt]
+        return send_file(
+            os.path.abspath(path),
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=f"segmentacion_{version_id}.{extension}"
+        )
+    except Exception as e:
+        logger.error(f"Error exportando segmentación: {str(e)}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
+def _number_arg(name, cast, default=None):
+    """
+    Lee un parámetro numérico de la query string; ValueError si no es un número válido.
+    """
+    raw = request.args.get(name)
+    if raw is None or raw == "":
+        return default
+    try:
+        return cast(raw)
+    except ValueError:
+        raise ValueError(f"{name} debe ser un número válido")
+
+@app.route("/api/segmentation/query", methods=["GET"])
+@versioned_cache
+def query_segmentation():
+    """
+    Consulta filtrada y ordenada sobre la última versión, p. ej.
+    ?segmento=VIP&sort=monetario&order=desc&limit=100
+    ?segmento=Dormidos&recencia_min=180
+    Para la página siguiente se pasa ?after=<next_cursor>; la paginación sigue
+    en la versión del cursor aunque entretanto se haya publicado otra.
+    """
+    try:
+        segmentos = [s for s in request.args.get("segmento", "").split(",") if s]
+        try:
+            ranges = {}
+            for metric in QUERY_METRICS:
+                minimum = _number_arg(f"{metric}_min", float)
+                maximum = _number_arg(f"{metric}_max", float)
+                if minimum is not None or maximum is not None:
+                    ranges[metric] = (minimum, maximum)
+            limit = _number_arg("limit", int, DEFAULT_QUERY_LIMIT)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        sort = request.args.get("sort", "monetario")
+        order = request.args.get("order", "desc").lower()
+        if order not in ("asc", "desc"):
+            return jsonify({"success": False, "message": "order debe ser asc o desc"}), 400
+
+        db = get_db()
+        after = request.args.get("after")
+        if after:
+            # Las versiones publicadas no cambian: seguir paginando en la del cursor
+            try:
+                version_id = decode_cursor(after)["version_id"]
+            except ValueError as e:
+                return jsonify({"success": False, "message": str(e)}), 400
+            if not is_version_complete(db, version_id):
+                return jsonify({
+                    "success": False,
+                    "message": "La versión del cursor ya no está disponible; reinicie la consulta sin after"
+                }), 409
+        else:
+            version_id = get_latest_version_id(db)
+            if not version_id:
+                return jsonify({"success": False, "message": "No hay datos de segmentación"}), 404
+
+        try:
+            clientes, next_cursor = query_segments(
+                db, version_id,
+                segmentos=segmentos,
+                ranges=ranges,
+                sort=sort,
+                descending=order == "desc",
+                limit=limit,
+                after=after
+            )
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        return jsonify({
+            "success": True,
+            "version_id": version_id,
+            "clientes": clientes,
+            "next_cursor": next_cursor
+        })
+    except Exception as e:
+        logger.error(f"Error consultando segmentación: {str(e)}")
+        return jsonify({"success": False, "error": str(e)}), 500
+
 @app.route("/api/segmentation/status", methods=["GET"])
+@versioned_cache
 def get_segmentation_status():
     try:
         db = get_db()
 
-        last_segment = db.customer_segments.find_one(sort=[("fecha_calculo", -1)])
+        last_segment = get_latest_version(db)
         if not last_segment:
             return jsonify({
                 "success": False,
@@ -149,22 +316,19 @@ def check_new_data():
     try:
         db = get_db()
 
-        last_seg = db.customer_segments.find_one(sort=[("fecha_calculo", -1)])
+        last_seg = get_latest_version(db)
         if not last_seg:
             return jsonify({"new_data_count": "unknown", "should_train": True})
 
         last_date = last_seg["fecha_calculo"]
 
         # Contar ventas nuevas
-        count = db.ventas.count_documents({
-            "createdAT": {"$gt": last_date},
-            "estado": {"$in": ["Procesado", "Completado", "Entregado"]}
-        })
+        count = count_new_sales(db, last_date)
 
         return jsonify({
             "success": True,
             "new_data_count": count,
-            "should_train": count > 50
+            "should_train": count >= NEW_SALES_THRESHOLD
         })
     except Exception as e:
         logger.error(f"Error chequeando nuevos datos: {str(e)}")
@@ -2,9 +2,19 @@ from sklearn.cluster import KMeans
 import numpy as np
 import joblib
 import os
+import time
 from datetime import datetime
 
 MODEL_PATH = "models/kmeans_model.pkl"
+NUM_CLUSTERS = 4
+FEATURES = ["Recencia", "Frecuencia", "Monetario"]
+
+# Arranque en caliente: reinicios del entrenamiento completo y tolerancia de inercia
+FULL_N_INIT = 10
+WARM_START_INERTIA_TOLERANCE = float(os.getenv('WARM_START_INERTIA_TOLERANCE', 0.1))
+
+# Nombres de segmento de mejor a peor valor RFM combinado
+SEGMENT_NAMES = ["VIP", "Fieles", "Ocasionales", "Dormidos"]
 
 def model_needs_retraining():
     if not os.path.exists(MODEL_PATH): return True
@@ -17,16 +27,104 @@ def get_or_train_kmeans(data):
         return joblib.load(MODEL_PATH)
 
     print("🔁 Entrenando nuevo modelo KMeans")
-    kmeans = KMeans(n_clusters=4, random_state=42)
+    kmeans = KMeans(n_clusters=NUM_CLUSTERS, random_state=42)
     kmeans.fit(data)
     joblib.dump(kmeans, MODEL_PATH)
     return kmeans
 
+def name_segments(centroids):
+    """
+    Asigna nombres a los clusters ordenando los centroides por su suma RFM.
+    Con menos de 4 clusters se reparten los nombres de los extremos hacia el centro.
+    """
+    orden = np.argsort(-centroids.sum(axis=1))
+    if len(orden) == 1:
+        return {orden[0]: SEGMENT_NAMES[0]}
+    ultimo = len(SEGMENT_NAMES) - 1
+    return {
+        cluster: SEGMENT_NAMES[round(rank * ultimo / (len(orden) - 1))]
+        for rank, cluster in enumerate(orden)
+    }
+
 def train_kmeans_model(df):
     model = get_or_train_kmeans(df[["Recencia", "Frecuencia", "Monetario"]])
     df["Segmento"] = model.predict(df[["Recencia", "Frecuencia", "Monetario"]])
-    centroids = model.cluster_centers_
-    orden = np.argsort(-centroids.sum(axis=1))
-    nombres = {orden[0]: "VIP", orden[1]: "Fieles", orden[2]: "Ocasionales", orden[3]: "Dormidos"}
-    df["Segmento_Nombre"] = df["Segmento"].map(nombres)
-    return df
\ No newline at end of file
+    df["Segmento_Nombre"] = df["Segmento"].map(name_segments(model.cluster_centers_))
+    return df
+
+def train_partition_model(df):
+    """
+    Entrena un KMeans propio para una partición, sin usar el modelo cacheado
+    en disco (que es compartido y corresponde a la segmentación global).
+    """
+    n_clusters = min(NUM_CLUSTERS, len(df))
+    kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
+    df["Segmento"] = kmeans.fit_predict(df[["Recencia", "Frecuencia", "Monetario"]])
+    df["Segmento_Nombre"] = df["Segmento"].map(name_segments(kmeans.cluster_centers_))
+    return df
+
+def segment_centroids(df):
+    """
+    Centroides (en el espacio escalado) de cada segmento asignado, ordenados por número de segmento.
+    """
+    return df.groupby("Segmento")[FEATURES].mean().sort_index().to_numpy()
+
+def inertia_per_customer(df):
+    """
+    Inercia media (distancia al cuadrado al centroide de su segmento) por cliente,
+    en el espacio escalado. Es la referencia con la que se valida el arranque en caliente.
+    """
+    features = df[FEATURES]
+    centroids = features.groupby(df["Segmento"]).transform("mean")
+    return float(((features - centroids) ** 2).to_numpy().sum() / len(df))
+
+def train_kmeans_warm_start(df, init_centroids=None, reference=None, tolerance=WARM_START_INERTIA_TOLERANCE):
+    """
+    Entrena KMeans partiendo de los centroides de la versión anterior (ya
+    llevados al espacio escalado actual) con una sola inicialización.
+    Si la inercia por cliente empeora más de `tolerance` respecto a la de
+    referencia, se repite el entrenamiento completo con FULL_N_INIT reinicios.
+    Sin centroides iniciales se hace directamente el entrenamiento completo.
+    Devuelve (df, estadísticas del entrenamiento).
+    """
+    features = df[FEATURES]
+    reference = reference or {}
+    stats = {"warm_start": init_centroids is not None, "restarted": False}
+
+    start = time.perf_counter()
+    model = None
+    if init_centroids is not None:
+        model = KMeans(n_clusters=len(init_centroids), init=init_centroids, n_init=1)
+        model.fit(features)
+        reference_inertia = reference.get("inertia_per_customer")
+        if reference_inertia is not None and model.inertia_ / len(df) > reference_inertia * (1 + tolerance):
+            print("⚠️ La inercia empeoró con el arranque en caliente, se reentrena desde cero")
+            stats["restarted"] = True
+            model = None
+
+    cold = None
+    if model is None:
+        cold_start = time.perf_counter()
+        model = KMeans(n_clusters=NUM_CLUSTERS, random_state=42, n_init=FULL_N_INIT)
+        model.fit(features)
+        cold = {"iterations": int(model.n_iter_), "seconds": time.perf_counter() - cold_start}
+    seconds = time.perf_counter() - start
+
+    df["Segmento"] = model.labels_
+    df["Segmento_Nombre"] = df["Segmento"].map(name_segments(model.cluster_centers_))
+
+    stats.update({
+        "iterations": int(model.n_iter_),
+        "seconds": seconds,
+        "inertia_per_customer": float(model.inertia_ / len(df))
+    })
+
+    # Ahorro estimado frente al último entrenamiento completo conocido,
+    # que se arrastra de versión en versión como referencia
+    if cold is None:
+        cold = reference.get("cold")
+        if cold:
+            stats["iterations_saved"] = int(cold["iterations"] * FULL_N_INIT - stats["iterations"])
+            stats["seconds_saved"] = cold["seconds"] - seconds
+    stats["cold"] = cold
+    return df, stats
@@ -0,0 +1,99 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Número de cuantiles por métrica (quintiles: puntuaciones 1 a 5)
+NUM_SCORES = 5
+
+# Tabla de reglas: la primera regla que cumple el cliente decide su segmento.
+# "min"/"max" son límites inclusivos sobre las puntuaciones R, F y M.
+DEFAULT_RULES = [
+    {"segmento": "VIP", "min": {"R": 4, "F": 4, "M": 4}},
+    {"segmento": "Fieles", "min": {"R": 3, "F": 3}},
+    {"segmento": "Dormidos", "max": {"R": 2}},
+]
+DEFAULT_SEGMENT = "Ocasionales"
+
+def load_rules():
+    """
+    Reglas de RFM_QUANTILE_RULES (JSON con el mismo formato que DEFAULT_RULES) o las de por defecto.
+    """
+    rules = os.getenv('RFM_QUANTILE_RULES')
+    return json.loads(rules) if rules else DEFAULT_RULES
+
+def quantile_scores(values, num_scores=NUM_SCORES):
+    """
+    Puntuación 1..N por rango percentil (mayor valor = mayor puntuación).
+    Los empates reciben el rango más bajo del grupo, así que un valor repetido
+    por muchos clientes (p. ej. una sola compra) nunca sube de cuantil por
+    ocupar varios límites a la vez.
+    """
+    pct = pd.Series(values).rank(method="min", pct=True).to_numpy()
+    return np.clip(np.ceil(pct * num_scores), 1, num_scores).astype(int)
+
+def score_boundaries(values, scores, num_scores=NUM_SCORES):
+    """
+    Límites resultantes: valor máximo de cada puntuación 1..N-1 (None si quedó vacía).
+    """
+    return [
+        float(values[scores == score].max()) if (scores == score).any() else None
+        for score in range(1, num_scores)
+    ]
+
+def assign_segments(scores, rules, default=DEFAULT_SEGMENT):
+    """
+    Aplica la tabla de reglas de forma vectorizada. Devuelve (números, nombres de segmento).
+    """
+    names = [rule["segmento"] for rule in rules] + [default]
+    conditions = []
+    for rule in rules:
+        condition = np.ones(len(scores["R"]), dtype=bool)
+        for metric, limit in rule.get("min", {}).items():
+            condition &= scores[metric] >= limit
+        for metric, limit in rule.get("max", {}).items():
+            condition &= scores[metric] <= limit
+        conditions.append(condition)
+    numbers = np.select(conditions, np.arange(len(rules)), default=len(rules))
+    return numbers, np.array(names, dtype=object)[numbers]
+
+def score_rfm_quantiles(rfm_data, rules=None, num_scores=NUM_SCORES):
+    """
+    Segmentación RFM clásica por cuantiles: puntúa recencia, frecuencia y monto
+    de 1 a num_scores y asigna el segmento con la tabla de reglas.
+    Devuelve (DataFrame con el mismo formato que train_kmeans_model, límites por métrica).
+    """
+    rules = rules or load_rules()
+
+    df = pd.DataFrame(rfm_data)
+    for col in ["recencia_dias", "num_compras", "total_gastado"]:
+        df[col] = pd.to_numeric(df[col], errors="coerce")
+    df = df.dropna(subset=["recencia_dias", "num_compras", "total_gastado"]).reset_index(drop=True)
+
+    recencia = df["recencia_dias"].to_numpy(dtype=float)
+    frecuencia = df["num_compras"].to_numpy(dtype=float)
+    monetario = df["total_gastado"].to_numpy(dtype=float)
+
+    # Menor recencia = mejor, así que se puntúa la recencia negada
+    scores = {
+        "R": quantile_scores(-recencia, num_scores),
+        "F": quantile_scores(frecuencia, num_scores),
+        "M": quantile_scores(monetario, num_scores),
+    }
+    boundaries = {
+        "recencia_dias": score_boundaries(-recencia, scores["R"], num_scores),
+        "num_compras": score_boundaries(frecuencia, scores["F"], num_scores),
+        "total_gastado": score_boundaries(monetario, scores["M"], num_scores),
+    }
+    # Volver a días para la recencia (límite = recencia mínima de cada puntuación)
+    boundaries["recencia_dias"] = [None if b is None else -b for b in boundaries["recencia_dias"]]
+    numbers, names = assign_segments(scores, rules)
+
+    df["Recencia"] = scores["R"]
+    df["Frecuencia"] = scores["F"]
+    df["Monetario"] = scores["M"]
+    df["Segmento"] = numbers
+    df["Segmento_Nombre"] = names
+
+    return df, boundaries
@@ -1,22 +1,137 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from bson import ObjectId
 from db.mongo import get_db
 from datetime import datetime
 
+# Número de rangos de cliente que se agregan en paralelo (1 = una sola agregación)
+EXTRACTION_PARALLELISM = int(os.getenv('EXTRACTION_PARALLELISM', 1))
+
+# Muestras por rango usadas para calcular los puntos de corte
+SPLIT_SAMPLES_PER_RANGE = 200
+
+ESTADOS_MATCH = {"estado": {"$in": ["Procesado", "Completado", "Entregado"]}}
+
+def _rfm_pipeline(match, fecha_actual):
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": "$cliente",
+            "ultima_compra": {"$max": "$createdAT"},
+            "num_compras": {"$sum": 1},
+            "total_gastado": {"$sum": "$total"}
+        }},
+        {"$project": {
+            "cliente_id": "$_id",
+            "recencia_dias": {"$dateDiff": {"startDate": "$ultima_compra", "endDate": fecha_actual, "unit": "day"}},
+            "num_compras": 1,
+            "total_gastado": 1
+        }}
+    ]
+
 def extract_rfm_data():
+    db = get_db()
+    fecha_actual = datetime.now()
+    pipeline = _rfm_pipeline(ESTADOS_MATCH, fecha_actual)
+    return list(db.ventas.aggregate(pipeline))
+
+def _split_points(db, n_ranges):
+    """
+    Puntos de corte del espacio de clientes a partir de una muestra aleatoria
+    de ventas ($sample), para repartir la agregación en n_ranges rangos parecidos.
+    """
+    sample_size = n_ranges * SPLIT_SAMPLES_PER_RANGE
+    sample = db.ventas.aggregate([
+        {"$sample": {"size": sample_size}},
+        {"$project": {"_id": 0, "cliente": 1}}
+    ])
+    values = {doc.get("cliente") for doc in sample}
+    # Los rangos se arman sobre un solo tipo BSON (normalmente ObjectId)
+    clientes = sorted(v for v in values if isinstance(v, ObjectId)) or sorted(v for v in values if isinstance(v, str))
+    if not clientes:
+        return []
+    points = [clientes[len(clientes) * i // n_ranges] for i in range(1, n_ranges)]
+    return sorted(set(points))
+
+def _has_cliente_index(db):
+    """
+    True si algún índice de ventas permite filtrar por rango de cliente:
+    (cliente, ...) o (estado, cliente, ...), como el que crea ensure_indexes.
+    """
+    for info in db.ventas.index_information().values():
+        fields = [field for field, _ in info["key"]]
+        if fields[:1] == ["cliente"] or fields[:2] == ["estado", "cliente"]:
+            return True
+    return False
+
+def extract_rfm_data_parallel(n_ranges=EXTRACTION_PARALLELISM):
+    """
+    Extrae los mismos datos que extract_rfm_data dividiendo los clientes en
+    n_ranges rangos y agregando cada rango en paralelo (un hilo y un cursor
+    por rango). Como todas las ventas de un cliente caen en el mismo rango,
+    concatenar los resultados equivale a la agregación única.
+    Sin un índice por cliente cada rango recorrería ventas completa, así que
+    en ese caso se usa la agregación única.
+    """
+    if n_ranges <= 1:
+        return extract_rfm_data()
+
+    db = get_db()
+    if not _has_cliente_index(db):
+        print("⚠️ ventas no tiene índice por cliente (python ensure_indexes.py): se usa la agregación única")
+        return extract_rfm_data()
+    fecha_actual = datetime.now()
+    points = _split_points(db, n_ranges)
+    if not points:
+        return extract_rfm_data()
+
+    # Rangos [None, p1), [p1, p2), ..., [pk, None]
+    bounds = [None] + points + [None]
+    matches = []
+    for lower, upper in zip(bounds[:-1], bounds[1:]):
+        cliente = {}
+        if lower is not None:
+            cliente["$gte"] = lower
+        if upper is not None:
+            cliente["$lt"] = upper
+        matches.append({**ESTADOS_MATCH, "cliente": cliente})
+
+    # Los clientes nulos o de otro tipo no entran en ningún rango: se agregan aparte
+    first_point = points[0]
+    matches.append({**ESTADOS_MATCH, "cliente": {"$not": {"$type": _bson_type(first_point)}}})
+
+    def aggregate(match):
+        return list(db.ventas.aggregate(_rfm_pipeline(match, fecha_actual), allowDiskUse=True))
+
+    with ThreadPoolExecutor(max_workers=len(matches)) as executor:
+        parts = list(executor.map(aggregate, matches))
+    return [row for part in parts for row in part]
+
+def _bson_type(value):
+    return "string" if isinstance(value, str) else "objectId"
+
+def extract_rfm_data_by_partition(partition_field):
+    """
+    Extrae RFM de todas las particiones en una sola agregación agrupando por
+    (valor de partition_field, cliente). Cada registro incluye "particion".
+    """
     db = get_db()
     fecha_actual = datetime.now()
     pipeline = [
         {"$match": {"estado": {"$in": ["Procesado", "Completado", "Entregado"]}}},
         {"$group": {
-            "_id": "$cliente",
+            "_id": {"particion": f"${partition_field}", "cliente": "$cliente"},
             "ultima_compra": {"$max": "$createdAT"},
             "num_compras": {"$sum": 1},
             "total_gastado": {"$sum": "$total"}
         }},
         {"$project": {
-            "cliente_id": "$_id",
+            "_id": 0,
+            "particion": "$_id.particion",
+            "cliente_id": "$_id.cliente",
             "recencia_dias": {"$dateDiff": {"startDate": "$ultima_compra", "endDate": fecha_actual, "unit": "day"}},
             "num_compras": 1,
             "total_gastado": 1
         }}
     ]
-    return list(db.ventas.aggregate(pipeline))
\ No newline at end of file
+    return list(db.ventas.aggregate(pipeline, allowDiskUse=True))
@@ -1,4 +1,6 @@
 import os
+from urllib.parse import parse_qs, urlsplit
+
 import pymongo
 import certifi
 from dotenv import load_dotenv
@@ -6,7 +8,32 @@ from dotenv import load_dotenv
 load_dotenv()
 MONGO_URI = os.getenv('MONGO_URI')
 DB_NAME = os.getenv('DB_NAME')
+# Pasar el bundle de CA de certifi: 'True', 'False' o 'auto' (según la URI)
+MONGO_TLS = os.getenv('MONGO_TLS', 'auto')
+
+_client = None
+
+
+def uses_tls(uri):
+    """
+    Si la URI activa TLS: mongodb+srv lo hace por defecto y mongodb:// con
+    tls=true o ssl=true. Un Mongo local sin TLS (p. ej. pruebas de carga) no acepta tlsCAFile.
+    """
+    if MONGO_TLS != 'auto':
+        return MONGO_TLS == 'True'
+    if not uri:
+        return False
+    parts = urlsplit(uri)
+    options = {key.lower(): values[-1].lower() for key, values in parse_qs(parts.query).items()}
+    if "tls" in options or "ssl" in options:
+        return options.get("tls", options.get("ssl")) == "true"
+    return parts.scheme == "mongodb+srv"
+
 
 def get_db():
-    client = pymongo.MongoClient(MONGO_URI, tlsCAFile=certifi.where())
-    return client[DB_NAME]
+    # Un solo MongoClient por proceso (es thread-safe y mantiene su pool de conexiones)
+    global _client
+    if _client is None:
+        tls_options = {"tlsCAFile": certifi.where()} if uses_tls(MONGO_URI) else {}
+        _client = pymongo.MongoClient(MONGO_URI, **tls_options)
+    return _client[DB_NAME]
@@ -0,0 +1,26 @@
+"""
+Crea los índices de MongoDB que usan la API, el scheduler y la migración.
+
+Ejecutar en cada despliegue, antes de arrancar la aplicación (create_index es
+idempotente, así que volver a ejecutarlo no hace nada si ya existen).
+
+Uso:
+    python ensure_indexes.py
+"""
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from db.mongo import get_db
+from models.model_persistence import ensure_indexes
+
+
+def main():
+    ensure_indexes(get_db())
+    print("✅ Índices creados")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
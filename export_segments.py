@@ -0,0 +1,47 @@
+"""
+Exporta una versión de customer_segments a Parquet, Arrow IPC o CSV.
+
+Uso:
+    python export_segments.py --format parquet
+    python export_segments.py --version-id <id> --format arrow --output segmentos.arrow
+"""
+import argparse
+import os
+import shutil
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from db.mongo import get_db
+from models.model_persistence import get_latest_version_id
+from models.segment_export import EXPORT_BATCH_SIZE, EXPORT_FORMATS, export_version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exportar una versión de la segmentación RFM")
+    parser.add_argument("--version-id", help="Versión a exportar (por defecto la última)")
+    parser.add_argument("--format", choices=sorted(EXPORT_FORMATS), default="parquet")
+    parser.add_argument("--output", help="Copiar el archivo exportado a esta ruta")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    version_id = args.version_id or get_latest_version_id(get_db())
+    if not version_id:
+        print("🚫 No hay datos de segmentación")
+        return 1
+
+    path = export_version(version_id, args.format, batch_size=args.batch_size)
+    if not path:
+        print(f"🚫 Versión no encontrada: {version_id}")
+        return 1
+
+    if args.output:
+        shutil.copyfile(path, args.output)
+        path = args.output
+
+    print(f"✅ Versión {version_id} exportada en {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
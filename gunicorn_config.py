@@ -1,5 +1,8 @@
-workers = 5
-threads = 2
-timeout = 5000  # Aumentar a 1000 segundos (16.6 minutos)
-max_requests = 1000
-max_requests_jitter = 50
\ No newline at end of file
+import os
+
+# Valores por defecto de producción; se pueden sobrescribir por entorno (p. ej. desde test/loadtest.py)
+workers = int(os.getenv('GUNICORN_WORKERS', 5))
+threads = int(os.getenv('GUNICORN_THREADS', 2))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 5000))  # Aumentar a 1000 segundos (16.6 minutos)
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 50))
\ No newline at end of file
@@ -0,0 +1,49 @@
+"""
+Migra los cliente_id de customer_segments guardados como ObjectId a string.
+
+La migración es reanudable: si se interrumpe, volver a ejecutarla continúa
+desde el último lote procesado. Hasta que termine, las consultas de segmento por
+cliente también buscan la forma ObjectId en las versiones que aún la tengan
+(compatibilidad temporal de models.model_persistence.cliente_id_lookup_values).
+
+Uso:
+    python migrate_cliente_ids.py
+    python migrate_cliente_ids.py --version-id <id> --batch-size 500 --max-docs-per-second 1000
+"""
+import argparse
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from db.mongo import get_db
+from models.cliente_id_migration import migrate_cliente_ids
+from models.model_persistence import ensure_indexes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrar cliente_id de customer_segments a string")
+    parser.add_argument("--version-id", help="Migrar solo esta versión (por defecto todas, de la más nueva a la más antigua)")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--max-docs-per-second", type=int, default=5000, help="0 = sin límite")
+    parser.add_argument("--dry-run", action="store_true", help="Contar documentos sin modificarlos")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    db = get_db()
+    ensure_indexes(db)
+    updated = migrate_cliente_ids(
+        db,
+        version_id=args.version_id,
+        batch_size=args.batch_size,
+        max_docs_per_second=args.max_docs_per_second,
+        dry_run=args.dry_run
+    )
+    print(f"✅ {updated} documentos {'por migrar' if args.dry_run else 'migrados'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
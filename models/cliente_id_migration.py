@@ -0,0 +1,106 @@
+import logging
+import time
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from models.model_persistence import canonical_cliente_id
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_ID = "customer_segments_cliente_id_string"
+
+
+def _versions_newest_first(db):
+    """
+    Versiones existentes de la más reciente a la más antigua, para que la
+    versión que sirve la API quede migrada primero.
+    """
+    pipeline = [
+        {"$group": {"_id": "$version_id", "fecha_calculo": {"$max": "$fecha_calculo"}}},
+        {"$sort": {"fecha_calculo": -1}}
+    ]
+    return [doc["_id"] for doc in db.customer_segments.aggregate(pipeline, allowDiskUse=True)]
+
+
+def _chunks(cursor, size):
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def migrate_cliente_ids(db, version_id=None, batch_size=1000, max_docs_per_second=5000, dry_run=False):
+    """
+    Reescribe en su lugar los cliente_id guardados como ObjectId a su forma
+    canónica (string), por lotes y con límite de velocidad.
+    El avance se guarda en la colección migrations, así que puede
+    interrumpirse y volver a lanzarse: continúa con los documentos pendientes.
+    Devuelve el número de documentos actualizados.
+    """
+    state = db.migrations.find_one({"_id": MIGRATION_ID}) or {}
+    completed = set(state.get("completed_versions", []))
+
+    versions = [version_id] if version_id else _versions_newest_first(db)
+    updated_total = 0
+
+    for version in versions:
+        if version in completed:
+            continue
+
+        logger.info(f"Migrando cliente_id de la versión {version}")
+
+        # Un solo cursor sobre el índice (version_id, cliente_id): solo recorre las
+        # entradas ObjectId pendientes. No hace falta ordenar por _id ni reanudar desde
+        # last_id, porque un documento ya reescrito deja de cumplir el filtro. last_id
+        # queda en el checkpoint solo como referencia del avance.
+        cursor = db.customer_segments.find(
+            {"version_id": version, "cliente_id": {"$type": "objectId"}},
+            {"cliente_id": 1},
+            batch_size=batch_size
+        ).hint([("version_id", 1), ("cliente_id", 1)])
+
+        for batch in _chunks(cursor, batch_size):
+            started = time.monotonic()
+            if not dry_run:
+                # El filtro incluye el valor original para no pisar un documento ya reescrito
+                db.customer_segments.bulk_write([
+                    UpdateOne(
+                        {"_id": doc["_id"], "cliente_id": doc["cliente_id"]},
+                        {"$set": {"cliente_id": canonical_cliente_id(doc["cliente_id"])}}
+                    )
+                    for doc in batch
+                ], ordered=False)
+
+            last_id = batch[-1]["_id"]
+            updated_total += len(batch)
+            if not dry_run:
+                db.migrations.update_one(
+                    {"_id": MIGRATION_ID},
+                    {"$set": {"current_version": version, "last_id": last_id, "updated_at": datetime.utcnow()}},
+                    upsert=True
+                )
+
+            # Limitar la velocidad para no competir con las lecturas de la API
+            if max_docs_per_second:
+                pause = len(batch) / max_docs_per_second - (time.monotonic() - started)
+                if pause > 0:
+                    time.sleep(pause)
+
+        if not dry_run:
+            db.migrations.update_one(
+                {"_id": MIGRATION_ID},
+                {
+                    "$addToSet": {"completed_versions": version},
+                    "$unset": {"current_version": "", "last_id": ""},
+                    "$set": {"updated_at": datetime.utcnow()}
+                },
+                upsert=True
+            )
+        logger.info(f"Versión {version} migrada")
+
+    return updated_total
@@ -3,29 +3,163 @@ from datetime import datetime
 import pytz
 from bson.objectid import ObjectId
 
-def save_results_to_db(df):
-    db = get_db()
+# Versiones ya comprobadas sin cliente_id ObjectId (las versiones no cambian al publicarse)
+_string_id_versions = set()
+
+def canonical_cliente_id(cliente_id):
+    """
+    Representación canónica de cliente_id en customer_segments: siempre string
+    (el hex del ObjectId cuando viene de ventas.cliente).
+    """
+    if isinstance(cliente_id, dict) and "$oid" in cliente_id:
+        cliente_id = cliente_id["$oid"]
+    return None if cliente_id is None else str(cliente_id)
+
+def cliente_id_lookup_values(db, version_id, cliente_ids):
+    """
+    Valores de cliente_id a buscar en una versión para los ids canónicos dados.
+    Las versiones escritas antes de la forma canónica guardan ObjectId hasta que
+    migrate_cliente_ids.py las reescribe; mientras les quede alguno se busca
+    también la forma ObjectId. Compatibilidad temporal: quitar cuando todas las
+    versiones en uso estén migradas.
+    """
+    values = list(cliente_ids)
+    if version_id in _string_id_versions:
+        return values
+    if db.customer_segments.find_one({"version_id": version_id, "cliente_id": {"$type": "objectId"}}, {"_id": 1}):
+        return values + [ObjectId(c) for c in cliente_ids if ObjectId.is_valid(c)]
+    _string_id_versions.add(version_id)
+    return values
+
+def ensure_indexes(db):
+    """
+    Crea los índices que usan las consultas sobre customer_segments y
+    segmentation_versions. Se ejecuta en el despliegue (python ensure_indexes.py),
+    no en las peticiones: create_index es idempotente pero cada llamada va a MongoDB.
+    """
+    db.customer_segments.create_index([("fecha_calculo", -1)])
+    db.segmentation_versions.create_index([("published", 1), ("fecha_publicacion", -1)])
+    db.customer_segments.create_index([("version_id", 1), ("cliente_id", 1)])
+    # Consultas filtradas/ordenadas por métrica, con o sin segmento (ver models/segment_query.py)
+    for metric in ("recencia_dias", "num_compras", "total_gastado"):
+        db.customer_segments.create_index([("version_id", 1), ("segmento", 1), (metric, 1), ("_id", 1)])
+        db.customer_segments.create_index([("version_id", 1), (metric, 1), ("_id", 1)])
+    # Rangos de cliente de la extracción paralela (ver data/rfm_extractor.py)
+    db.ventas.create_index([("estado", 1), ("cliente", 1)])
+
+def save_results_to_db(df, version_id=None, fecha_calculo=None, extra_fields=None, db=None):
+    """
+    Inserta los resultados de una segmentación como una nueva versión.
+    Para escribir varias partes bajo una misma versión (p. ej. particiones)
+    se pasan version_id y fecha_calculo comunes, y extra_fields se añade a cada registro.
+    Devuelve el version_id usado.
+    """
+    if db is None:
+        db = get_db()
 
     # 1. Obtener fecha actual en zona horaria de Bolivia
-    bolivia_timezone = pytz.timezone("America/La_Paz")
-    now_bolivia = datetime.now(bolivia_timezone)
+    if fecha_calculo is None:
+        bolivia_timezone = pytz.timezone("America/La_Paz")
+        fecha_calculo = datetime.now(bolivia_timezone)
 
     # 2. Crear un nuevo version_id único basado en ObjectId
-    version_id = str(ObjectId())
+    if version_id is None:
+        version_id = str(ObjectId())
 
-    # 3. Preparar los nuevos registros
+    # 3. Preparar los nuevos registros (con los valores RFM originales si vienen en el DataFrame)
+    if "recencia_dias" in df.columns:
+        rfm_cols = ("recencia_dias", "num_compras", "total_gastado")
+    else:
+        rfm_cols = ("Recencia", "Frecuencia", "Monetario")
     records = []
     for _, row in df.iterrows():
-        records.append({
-            "cliente_id": row["cliente_id"],
-            "recencia_dias": float(row["Recencia"]),
-            "num_compras": float(row["Frecuencia"]),
-            "total_gastado": float(row["Monetario"]),
+        record = {
+            "cliente_id": canonical_cliente_id(row["cliente_id"]),
+            "recencia_dias": float(row[rfm_cols[0]]),
+            "num_compras": float(row[rfm_cols[1]]),
+            "total_gastado": float(row[rfm_cols[2]]),
             "segmento": row["Segmento_Nombre"],
             "segmento_numero": int(row["Segmento"]),
-            "fecha_calculo": now_bolivia,
+            "fecha_calculo": fecha_calculo,
             "version_id": version_id  # ✅ Versión del análisis
-        })
+        }
+        if extra_fields:
+            record.update(extra_fields)
+        records.append(record)
 
     # 4. Insertar los nuevos registros sin borrar los anteriores
-    db.customer_segments.insert_many(records)
+    if records:
+        db.customer_segments.insert_many(records)
+    return version_id
+
+def begin_version(db, version_id, fecha_calculo, partition_field=None):
+    """
+    Registra una versión como pendiente antes de escribir sus filas. Mientras no
+    se publique, ninguna lectura la considera la versión actual.
+    """
+    db.segmentation_versions.update_one(
+        {"_id": version_id},
+        {"$set": {"fecha_calculo": fecha_calculo, "published": False, "particion_campo": partition_field}},
+        upsert=True
+    )
+
+def publish_version(db, version_id):
+    """
+    Publica una versión cuando todas sus filas y metadatos ya están escritos.
+    """
+    db.segmentation_versions.update_one(
+        {"_id": version_id},
+        {"$set": {"published": True, "fecha_publicacion": datetime.utcnow()}}
+    )
+
+def _pending_version_ids(db):
+    # Versiones en escritura o que fallaron antes de publicarse
+    return [doc["_id"] for doc in db.segmentation_versions.find({"published": False}, {"_id": 1})]
+
+def is_version_complete(db, version_id):
+    """
+    True si la versión existe y no quedó pendiente de publicar.
+    """
+    if db.segmentation_versions.find_one({"_id": version_id, "published": False}, {"_id": 1}):
+        return False
+    return db.customer_segments.find_one({"version_id": version_id}, {"_id": 1}) is not None
+
+def get_latest_version(db, partition_field=None):
+    """
+    Devuelve {"version_id", "fecha_calculo", "fecha_publicacion"} de la última
+    segmentación publicada (o None). Una versión solo es visible cuando todas sus
+    filas están escritas, así que nunca se sirve (ni se cachea) una versión a medias.
+    Por defecto solo considera segmentaciones globales; con partition_field, las
+    particionadas por ese campo.
+    """
+    published = db.segmentation_versions.find_one(
+        {"published": True, "particion_campo": partition_field},
+        sort=[("fecha_publicacion", -1)],
+        projection={"fecha_calculo": 1, "fecha_publicacion": 1}
+    )
+    if published:
+        return {
+            "version_id": published["_id"],
+            "fecha_calculo": published.get("fecha_calculo"),
+            "fecha_publicacion": published.get("fecha_publicacion")
+        }
+
+    # Compatibilidad con versiones escritas antes de la publicación explícita
+    legacy = db.customer_segments.find_one(
+        {
+            "version_id": {"$nin": _pending_version_ids(db)},
+            "particion_campo": partition_field if partition_field else {"$exists": False}
+        },
+        sort=[("fecha_calculo", -1)],
+        projection={"_id": 0, "version_id": 1, "fecha_calculo": 1}
+    )
+    if legacy:
+        legacy["fecha_publicacion"] = legacy.get("fecha_calculo")
+    return legacy
+
+def get_latest_version_id(db, partition_field=None):
+    """
+    Devuelve el version_id de la última segmentación publicada (o None).
+    """
+    last_segment = get_latest_version(db, partition_field)
+    return last_segment.get("version_id") if last_segment else None
@@ -0,0 +1,145 @@
+import csv
+import os
+import tempfile
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+from db.mongo import get_db
+from models.model_persistence import is_version_complete
+
+load_dotenv()
+
+# Directorio donde se cachean las exportaciones (una por versión y formato)
+EXPORT_DIR = os.getenv('EXPORT_DIR', 'exports')
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 50000))
+
+# Esquema columnar de customer_segments
+SCHEMA = pa.schema([
+    ("cliente_id", pa.string()),
+    ("recencia_dias", pa.float64()),
+    ("num_compras", pa.float64()),
+    ("total_gastado", pa.float64()),
+    ("segmento", pa.string()),
+    ("segmento_numero", pa.int64()),
+    ("fecha_calculo", pa.timestamp("ms", tz="UTC")),
+    ("version_id", pa.string()),
+    ("particion_campo", pa.string()),
+    ("particion", pa.string()),
+])
+COLUMNS = SCHEMA.names
+STRING_COLUMNS = ("cliente_id", "particion")
+
+# formato -> (extensión, mimetype)
+EXPORT_FORMATS = {
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "arrow": ("arrow", "application/vnd.apache.arrow.file"),
+    "csv": ("csv", "text/csv"),
+}
+
+
+def export_path(version_id, fmt):
+    extension, _ = EXPORT_FORMATS[fmt]
+    return os.path.join(EXPORT_DIR, f"{version_id}.{extension}")
+
+
+def _iter_column_batches(db, version_id, batch_size):
+    """
+    Recorre el cursor de una versión y va armando lotes columnares
+    (dict columna -> lista) de como máximo batch_size filas.
+    """
+    projection = {name: 1 for name in COLUMNS}
+    projection["_id"] = 0
+    cursor = db.customer_segments.find({"version_id": version_id}, projection, batch_size=batch_size)
+
+    columns = {name: [] for name in COLUMNS}
+    rows = 0
+    for doc in cursor:
+        for name in COLUMNS:
+            columns[name].append(doc.get(name))
+        rows += 1
+        if rows == batch_size:
+            yield columns
+            columns = {name: [] for name in COLUMNS}
+            rows = 0
+    if rows:
+        yield columns
+
+
+def _stringify(columns):
+    # cliente_id puede venir como ObjectId según el código que escribió la versión,
+    # y el valor de partición es el del campo de ventas (ObjectId, número...)
+    for name in STRING_COLUMNS:
+        columns[name] = [None if v is None else str(v) for v in columns[name]]
+    return columns
+
+
+def _to_record_batch(columns):
+    columns = _stringify(columns)
+    arrays = [pa.array(columns[field.name], type=field.type) for field in SCHEMA]
+    return pa.RecordBatch.from_arrays(arrays, schema=SCHEMA)
+
+
+def _write_parquet(db, version_id, path, batch_size):
+    with pq.ParquetWriter(path, SCHEMA) as writer:
+        for columns in _iter_column_batches(db, version_id, batch_size):
+            writer.write_table(pa.Table.from_batches([_to_record_batch(columns)]))
+
+
+def _write_arrow(db, version_id, path, batch_size):
+    with pa.OSFile(path, "wb") as sink, ipc.new_file(sink, SCHEMA) as writer:
+        for columns in _iter_column_batches(db, version_id, batch_size):
+            writer.write_batch(_to_record_batch(columns))
+
+
+def _write_csv(db, version_id, path, batch_size):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for columns in _iter_column_batches(db, version_id, batch_size):
+            columns = _stringify(columns)
+            writer.writerows(zip(*(columns[name] for name in COLUMNS)))
+
+
+WRITERS = {
+    "parquet": _write_parquet,
+    "arrow": _write_arrow,
+    "csv": _write_csv,
+}
+
+
+def export_version(version_id, fmt, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Exporta una versión de customer_segments al formato indicado y devuelve
+    la ruta del archivo. Las versiones son inmutables, así que si el archivo
+    ya existe en disco se devuelve directamente sin consultar MongoDB.
+    Devuelve None si la versión no existe.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Formato de exportación no soportado: {fmt}")
+
+    path = export_path(version_id, fmt)
+    if os.path.exists(path):
+        return path
+
+    db = get_db()
+    # Una versión sin publicar podría estar a medias: no se exporta ni se cachea
+    if not is_version_complete(db, version_id):
+        return None
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+
+    # Escribir en un temporal propio (único también entre hilos del mismo worker)
+    # y renombrar para que nunca se sirva un archivo a medias
+    fd, tmp_path = tempfile.mkstemp(dir=EXPORT_DIR, prefix=f"{version_id}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        WRITERS[fmt](db, version_id, tmp_path, batch_size)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return path
@@ -0,0 +1,118 @@
+import base64
+import json
+
+from bson.objectid import ObjectId
+
+# Nombre del parámetro -> campo en customer_segments
+QUERY_METRICS = {
+    "recencia": "recencia_dias",
+    "frecuencia": "num_compras",
+    "monetario": "total_gastado",
+}
+DEFAULT_QUERY_LIMIT = 100
+MAX_QUERY_LIMIT = 1000
+
+PROJECTION = {
+    "cliente_id": 1,
+    "recencia_dias": 1,
+    "num_compras": 1,
+    "total_gastado": 1,
+    "segmento": 1,
+}
+
+
+def encode_cursor(version_id, sort, descending, value, doc_id):
+    # El cursor lleva la versión y el orden con que se generó, para no continuar
+    # una paginación en otra versión ni con otros parámetros de orden
+    payload = json.dumps({
+        "version_id": version_id,
+        "sort": sort,
+        "order": "desc" if descending else "asc",
+        "value": value,
+        "_id": str(doc_id)
+    }).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """
+    Devuelve el dict del cursor (version_id, sort, order, value, _id).
+    """
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        data["_id"] = ObjectId(data["_id"])
+        if not all(key in data for key in ("version_id", "sort", "order", "value")):
+            raise KeyError
+        return data
+    except Exception:
+        raise ValueError("Cursor de paginación inválido")
+
+
+def query_segments(db, version_id, segmentos=None, ranges=None, sort="monetario", descending=True,
+                   limit=DEFAULT_QUERY_LIMIT, after=None):
+    """
+    Consulta los clientes de una versión filtrando por segmento y rangos de
+    recencia/frecuencia/monetario, ordenando por una métrica y paginando por
+    keyset (after = cursor devuelto por la página anterior, que debe ser de la
+    misma versión y con el mismo sort/order).
+    Usa los índices (version_id, segmento, métrica, _id) y (version_id, métrica, _id),
+    así que solo se leen las filas devueltas.
+    Devuelve (clientes, cursor de la página siguiente o None).
+    """
+    if sort not in QUERY_METRICS:
+        raise ValueError(f"Campo de orden no soportado: {sort}")
+    if not 1 <= limit <= MAX_QUERY_LIMIT:
+        raise ValueError(f"limit debe estar entre 1 y {MAX_QUERY_LIMIT}")
+
+    sort_field = QUERY_METRICS[sort]
+    conditions = [{"version_id": version_id}]
+
+    if segmentos:
+        conditions.append({"segmento": segmentos[0] if len(segmentos) == 1 else {"$in": segmentos}})
+
+    for metric, (minimum, maximum) in (ranges or {}).items():
+        bounds = {}
+        if minimum is not None:
+            bounds["$gte"] = minimum
+        if maximum is not None:
+            bounds["$lte"] = maximum
+        if bounds:
+            conditions.append({QUERY_METRICS[metric]: bounds})
+
+    # Keyset: continuar justo después de la última fila (métrica, _id) de la página anterior
+    if after:
+        position = decode_cursor(after)
+        if position["version_id"] != version_id:
+            raise ValueError("El cursor de paginación es de otra versión")
+        if position["sort"] != sort or position["order"] != ("desc" if descending else "asc"):
+            raise ValueError("El cursor de paginación se generó con otro sort/order")
+        value, doc_id = position["value"], position["_id"]
+        op = "$lt" if descending else "$gt"
+        conditions.append({"$or": [
+            {sort_field: {op: value}},
+            {sort_field: value, "_id": {op: doc_id}},
+        ]})
+
+    direction = -1 if descending else 1
+    cursor = db.customer_segments.find(
+        {"$and": conditions},
+        PROJECTION,
+        sort=[(sort_field, direction), ("_id", direction)],
+        limit=limit + 1
+    )
+    docs = list(cursor)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_cursor = encode_cursor(version_id, sort, descending, last.get(sort_field), last["_id"])
+
+    clientes = [{
+        "cliente_id": str(doc.get("cliente_id")),
+        "recencia_dias": doc.get("recencia_dias"),
+        "num_compras": doc.get("num_compras"),
+        "total_gastado": doc.get("total_gastado"),
+        "segmento": doc.get("segmento"),
+    } for doc in docs]
+    return clientes, next_cursor
@@ -0,0 +1,49 @@
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+RFM_COLUMNS = ["recencia_dias", "num_compras", "total_gastado"]
+
+
+def fingerprint_rfm_data(rfm_data):
+    """
+    Huella (sha256) de los datos RFM extraídos, independiente del orden en que
+    los devuelve la agregación: se ordena por cliente_id y se hashean las columnas.
+    """
+    df = pd.DataFrame(rfm_data, columns=["cliente_id"] + RFM_COLUMNS)
+    df["cliente_id"] = df["cliente_id"].astype(str)
+    df = df.sort_values("cliente_id", kind="mergesort")
+
+    digest = hashlib.sha256()
+    digest.update("\x00".join(df["cliente_id"]).encode("utf-8"))
+    for col in RFM_COLUMNS:
+        values = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype=np.float64)
+        digest.update(np.ascontiguousarray(values).tobytes())
+    return digest.hexdigest()
+
+
+def fingerprint_config(config):
+    """
+    Huella de la configuración del modelo (k, motor, escalado...).
+    """
+    payload = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def save_version_metadata(db, version_id, **fields):
+    """
+    Guarda (o completa) los metadatos de una versión en segmentation_versions.
+    """
+    db.segmentation_versions.update_one(
+        {"_id": version_id},
+        {"$set": fields},
+        upsert=True
+    )
+
+
+def get_version_metadata(db, version_id):
+    if not version_id:
+        return None
+    return db.segmentation_versions.find_one({"_id": version_id})
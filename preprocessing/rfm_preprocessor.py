@@ -1,13 +1,49 @@
+import numpy as np
 import pandas as pd
 from sklearn.preprocessing import StandardScaler
 
+# Columna original -> columna de trabajo
+RAW_COLUMNS = {"recencia_dias": "Recencia", "num_compras": "Frecuencia", "total_gastado": "Monetario"}
+
 def process_rfm_data(data):
+    result, _, _ = process_rfm_data_with_scaler(data)
+    return result
+
+def process_rfm_data_with_scaler(data):
+    """
+    Igual que process_rfm_data, pero devuelve también el scaler ajustado y la
+    recencia máxima usada para invertir la recencia, necesarios para llevar
+    centroides entre el espacio original y el escalado.
+    """
     df = pd.DataFrame(data)
     df.rename(columns={"recencia_dias": "Recencia", "num_compras": "Frecuencia", "total_gastado": "Monetario"}, inplace=True)
-    df["Recencia"] = df["Recencia"].max() - df["Recencia"]
+    max_recencia = df["Recencia"].max()
+    # Conservar los valores originales para guardarlos junto al segmento
+    for raw_col, col in RAW_COLUMNS.items():
+        df[raw_col] = df[col]
+    df["Recencia"] = max_recencia - df["Recencia"]
     df.dropna(inplace=True)
     scaler = StandardScaler()
     scaled = scaler.fit_transform(df[["Recencia", "Frecuencia", "Monetario"]])
     result = pd.DataFrame(scaled, columns=["Recencia", "Frecuencia", "Monetario"])
     result["cliente_id"] = df["cliente_id"].values
-    return result
\ No newline at end of file
+    for raw_col in RAW_COLUMNS:
+        result[raw_col] = df[raw_col].values
+    return result, scaler, max_recencia
+
+def centroids_to_raw(centroids, scaler, max_recencia):
+    """
+    Centroides escalados -> unidades originales (recencia_dias, num_compras, total_gastado).
+    """
+    raw = scaler.inverse_transform(np.asarray(centroids, dtype=float))
+    raw[:, 0] = max_recencia - raw[:, 0]
+    return raw
+
+def centroids_from_raw(raw_centroids, scaler, max_recencia):
+    """
+    Centroides en unidades originales -> espacio del scaler actual.
+    """
+    inverted = np.array(raw_centroids, dtype=float)
+    inverted[:, 0] = max_recencia - inverted[:, 0]
+    # Con los mismos nombres de columna con que se ajustó el scaler (evita el aviso de sklearn)
+    return scaler.transform(pd.DataFrame(inverted, columns=list(RAW_COLUMNS.values())))
@@ -1,73 +1,372 @@
-from data.rfm_extractor import extract_rfm_data
-from preprocessing.rfm_preprocessor import process_rfm_data
-from clustering.rfm_cluster import train_kmeans_model
-from models.model_persistence import save_results_to_db
+from data.rfm_extractor import extract_rfm_data_parallel, extract_rfm_data_by_partition
+from preprocessing.rfm_preprocessor import (
+    process_rfm_data, process_rfm_data_with_scaler, centroids_to_raw, centroids_from_raw
+)
+from clustering.rfm_cluster import (
+    train_kmeans_model, train_partition_model, train_kmeans_warm_start, segment_centroids,
+    inertia_per_customer, NUM_CLUSTERS
+)
+from clustering.rfm_quantile import score_rfm_quantiles, load_rules, NUM_SCORES
+from models.model_persistence import (
+    save_results_to_db, get_latest_version, get_latest_version_id, canonical_cliente_id,
+    cliente_id_lookup_values, begin_version, publish_version
+)
+from models.version_metadata import fingerprint_rfm_data, fingerprint_config, save_version_metadata, get_version_metadata
+from worker.profiling import StageProfiler
 from db.mongo import get_db
 from bson import ObjectId
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import pytz
+import multiprocessing
 import os
+import re
 import sys
 
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-def run_segmentation(force=False):
+# Estados de venta que cuentan para el análisis RFM
+ESTADOS_COMPLETADOS = ["Procesado", "Completado", "Entregado"]
+
+# Mínimo de ventas nuevas para justificar un nuevo entrenamiento
+NEW_SALES_THRESHOLD = int(os.getenv('NEW_SALES_THRESHOLD', 50))
+
+# Motor de segmentación por defecto: "kmeans" o "quantiles" (puntuación RFM por quintiles)
+SEGMENTATION_ENGINES = ("kmeans", "quantiles")
+SEGMENTATION_ENGINE = os.getenv('SEGMENTATION_ENGINE', 'kmeans')
+
+# Arrancar KMeans desde los centroides de la versión anterior
+KMEANS_WARM_START = os.getenv('KMEANS_WARM_START', 'False') == 'True'
+
+# Segmentación por partición: campo de ventas y procesos del pool (0 = todos los núcleos)
+PARTITION_FIELD = os.getenv('PARTITION_FIELD')
+PARTITION_WORKERS = int(os.getenv('PARTITION_WORKERS', 0))
+RFM_RECORD_KEYS = ("cliente_id", "recencia_dias", "num_compras", "total_gastado")
+PARTITION_FIELD_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_.]*$")
+
+# Tamaño de cada consulta $in en la búsqueda masiva de segmentos
+BULK_LOOKUP_CHUNK_SIZE = int(os.getenv('BULK_LOOKUP_CHUNK_SIZE', 5000))
+
+def count_new_sales(db, since):
+    """
+    Cuenta las ventas completadas registradas después de la fecha indicada.
+    """
+    return db.ventas.count_documents({
+        "createdAT": {"$gt": since},
+        "estado": {"$in": ESTADOS_COMPLETADOS}
+    })
+
+def segmentation_config(engine="kmeans", warm_start=False):
+    """
+    Configuración del modelo que determina el resultado de una segmentación.
+    Forma parte de la huella de cada versión.
+    """
+    if engine == "quantiles":
+        return {
+            "engine": "quantiles",
+            "num_scores": NUM_SCORES,
+            "rules": load_rules()
+        }
+    return {
+        "engine": "kmeans",
+        "num_clusters": NUM_CLUSTERS,
+        "scaling": "standard",
+        "warm_start": warm_start
+    }
+
+def check_insufficient_new_data(db, partition_field=None):
+    """
+    Devuelve la respuesta de "sin datos nuevos suficientes" si desde la última
+    segmentación (global o por partition_field) no se alcanzó el umbral de
+    ventas, o None si hay que recalcular.
+    """
+    # Obtener última fecha de segmentación publicada
+    last_seg = get_latest_version(db, partition_field)
+    if not last_seg:
+        return None
+
+    nuevas_ventas = count_new_sales(db, last_seg["fecha_calculo"])
+    if nuevas_ventas >= NEW_SALES_THRESHOLD:
+        return None
+
+    print(f"🚫 No hay suficientes ventas nuevas ({nuevas_ventas}) para recalcular.")
+    return {
+        "success": False,
+        "message": f"No hay suficientes datos nuevos ({nuevas_ventas} ventas nuevas).",
+        "new_data": nuevas_ventas
+    }
+
+def run_segmentation(force=False, warm_start=None, engine=None, profiler=None):
     """
     Ejecuta la segmentación RFM si hay suficientes nuevos datos o si force=True.
+    engine elige el motor: "kmeans" o "quantiles" (por defecto SEGMENTATION_ENGINE).
+    Con warm_start (por defecto KMEANS_WARM_START) KMeans arranca desde los
+    centroides de la versión publicada. El tiempo de CPU y la memoria de cada
+    etapa se registran con profiler y se guardan con la versión.
     """
+    profiler = profiler or StageProfiler()
+    engine = engine or SEGMENTATION_ENGINE
+    if engine not in SEGMENTATION_ENGINES:
+        raise ValueError(f"Motor de segmentación desconocido: {engine}")
+    if warm_start is None:
+        warm_start = KMEANS_WARM_START
     print("=== INICIANDO ANÁLISIS RFM ===")
     db = get_db()
 
-    # Obtener última fecha de segmentación
-    last_seg = db.customer_segments.find_one(sort=[("fecha_calculo", -1)])
-    last_seg_date = last_seg["fecha_calculo"] if last_seg else None
-
     # Hora actual Bolivia
     bolivia_tz = pytz.timezone('America/La_Paz')
     now_bolivia = datetime.now(bolivia_tz)
 
     # Verificar si hay suficientes nuevos datos
-    if not force and last_seg_date:
-        nuevas_ventas = db.ventas.count_documents({
-            "createdAT": {"$gt": last_seg_date},
-            "estado": {"$in": ["Procesado", "Completado", "Entregado"]}
-        })
-        if nuevas_ventas < 50:
-            print(f"🚫 No hay suficientes ventas nuevas ({nuevas_ventas}) para recalcular.")
-            return {
-                "success": False,
-                "message": f"No hay suficientes datos nuevos ({nuevas_ventas} ventas nuevas).",
-                "new_data": nuevas_ventas
-            }
-
-    # Extraer y procesar datos RFM
-    rfm_data = extract_rfm_data()
-    df_rfm_scaled = process_rfm_data(rfm_data)
-    df_rfm_segments = train_kmeans_model(df_rfm_scaled)
-
-    # Guardar nueva segmentación
-    save_results_to_db(df_rfm_segments)
+    if not force:
+        insufficient = check_insufficient_new_data(db)
+        if insufficient:
+            return insufficient
+
+    # Extraer datos RFM (en rangos paralelos si EXTRACTION_PARALLELISM > 1)
+    with profiler.stage("extraccion"):
+        rfm_data = extract_rfm_data_parallel()
+
+    # Si la entrada y la configuración coinciden con la versión publicada, reutilizarla
+    with profiler.stage("huella"):
+        config = segmentation_config(engine, warm_start)
+        input_fingerprint = fingerprint_rfm_data(rfm_data)
+        config_fingerprint = fingerprint_config(config)
+        latest_version_id = get_latest_version_id(db)
+        latest_meta = get_version_metadata(db, latest_version_id)
+    if latest_meta and latest_meta.get("input_fingerprint") == input_fingerprint \
+            and latest_meta.get("config_fingerprint") == config_fingerprint:
+        print(f"♻️ Datos RFM sin cambios, se reutiliza la versión {latest_version_id}")
+        return {
+            "success": True,
+            "cache_hit": True,
+            "engine": engine,
+            "version_id": latest_version_id,
+            "segments": latest_meta.get("segments", {}),
+            "records_processed": len(rfm_data),
+            "records_saved": 0,
+            "stages": profiler.stages,
+            "timestamp": now_bolivia.isoformat()
+        }
+
+    # Procesar y segmentar
+    training = None
+    centroids = None
+    boundaries = None
+    with profiler.stage("entrenamiento"):
+        if engine == "quantiles":
+            df_rfm_segments, boundaries = score_rfm_quantiles(rfm_data, rules=config["rules"])
+        else:
+            df_rfm_segments, centroids, training = _train_kmeans(rfm_data, warm_start, latest_meta)
+        segments = df_rfm_segments["Segmento_Nombre"].value_counts().to_dict()
+
+    # Guardar nueva segmentación y sus metadatos
+    with profiler.stage("guardado"):
+        version_id = str(ObjectId())
+        begin_version(db, version_id, now_bolivia)
+        save_results_to_db(df_rfm_segments, version_id=version_id, fecha_calculo=now_bolivia, db=db)
+    save_version_metadata(
+        db,
+        version_id,
+        fecha_calculo=now_bolivia,
+        config=config,
+        input_fingerprint=input_fingerprint,
+        config_fingerprint=config_fingerprint,
+        segments=segments,
+        records=len(df_rfm_segments),
+        centroids=centroids,
+        training=training,
+        boundaries=boundaries,
+        stages=profiler.stages
+    )
+    # Solo ahora la versión pasa a ser la actual
+    publish_version(db, version_id)
 
     return {
         "success": True,
-        "segments": df_rfm_segments["Segmento_Nombre"].value_counts().to_dict(),
+        "cache_hit": False,
+        "engine": engine,
+        "version_id": version_id,
+        "segments": segments,
         "records_processed": len(rfm_data),
         "records_saved": len(df_rfm_segments),
+        "training": training,
+        "stages": profiler.stages,
+        "timestamp": now_bolivia.isoformat()
+    }
+
+def _train_kmeans(rfm_data, warm_start, latest_meta):
+    """
+    Escala los datos y entrena KMeans (en caliente si se pide).
+    Devuelve (DataFrame segmentado, centroides en unidades originales, estadísticas).
+    """
+    df_rfm_scaled, scaler, max_recencia = process_rfm_data_with_scaler(rfm_data)
+    training = None
+    if warm_start:
+        # Partir de los centroides de la versión publicada, llevados al escalado actual
+        init_centroids = None
+        reference = None
+        if latest_meta and latest_meta.get("centroids"):
+            init_centroids = centroids_from_raw(latest_meta["centroids"], scaler, max_recencia)
+            reference = latest_meta.get("training")
+        df_rfm_segments, training = train_kmeans_warm_start(df_rfm_scaled, init_centroids, reference)
+    else:
+        df_rfm_segments = train_kmeans_model(df_rfm_scaled)
+        # Guardar la inercia también sin arranque en caliente, para que la
+        # siguiente versión entrenada en caliente tenga con qué compararse
+        training = {"warm_start": False, "inertia_per_customer": inertia_per_customer(df_rfm_segments)}
+    centroids = centroids_to_raw(segment_centroids(df_rfm_segments), scaler, max_recencia)
+    return df_rfm_segments, centroids.tolist(), training
+
+def _segment_partition(item):
+    """
+    Escala y segmenta una partición. Se ejecuta en un proceso del pool,
+    por eso recibe y devuelve solo datos serializables.
+    """
+    particion, records = item
+    # Igual que el dropna del preprocesado: sin filas completas no hay nada que escalar
+    records = [r for r in records if all(r.get(k) is not None for k in RFM_RECORD_KEYS)]
+    if not records:
+        return particion, None
+    df_rfm_scaled = process_rfm_data(records)
+    if df_rfm_scaled.empty:
+        return particion, None
+    return particion, train_partition_model(df_rfm_scaled)
+
+def run_partitioned_segmentation(partition_field=PARTITION_FIELD, force=False, max_workers=PARTITION_WORKERS,
+                                 profiler=None):
+    """
+    Segmenta por separado cada partición de ventas (p. ej. tienda o canal).
+    Extrae el RFM de todas las particiones en una sola agregación, entrena cada
+    partición en un pool de procesos y guarda todo bajo un mismo version_id.
+    """
+    profiler = profiler or StageProfiler()
+    if not partition_field or not PARTITION_FIELD_PATTERN.match(partition_field):
+        raise ValueError(f"Campo de partición inválido: {partition_field}")
+
+    print(f"=== INICIANDO ANÁLISIS RFM POR PARTICIÓN ({partition_field}) ===")
+    db = get_db()
+
+    bolivia_tz = pytz.timezone('America/La_Paz')
+    now_bolivia = datetime.now(bolivia_tz)
+
+    if not force:
+        insufficient = check_insufficient_new_data(db, partition_field)
+        if insufficient:
+            return insufficient
+
+    # Una sola pasada sobre ventas, agrupada por (partición, cliente)
+    with profiler.stage("extraccion"):
+        rfm_data = extract_rfm_data_by_partition(partition_field)
+        partitions = defaultdict(list)
+        for item in rfm_data:
+            particion = item.pop("particion", None)
+            partitions[particion].append(item)
+
+    version_id = str(ObjectId())
+    segments = {}
+    skipped = []
+    records_saved = 0
+
+    # La versión queda pendiente (invisible) hasta que se guarden todas las particiones
+    begin_version(db, version_id, now_bolivia, partition_field)
+
+    # Las particiones pequeñas se envían en bloques para no saturar el pool con tareas mínimas
+    workers = max_workers or os.cpu_count() or 1
+    chunksize = max(1, len(partitions) // (workers * 4))
+    # spawn y no fork: este proceso ya tiene hilos vivos (monitores de pymongo, y en el
+    # worker web los hilos de petición y el scheduler) y un fork podría heredar un lock tomado
+    context = multiprocessing.get_context("spawn")
+    with profiler.stage("entrenamiento_y_guardado"), \
+            ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        for particion, df_rfm_segments in executor.map(_segment_partition, partitions.items(), chunksize=chunksize):
+            if df_rfm_segments is None:
+                skipped.append(str(particion))
+                continue
+            save_results_to_db(
+                df_rfm_segments,
+                version_id=version_id,
+                fecha_calculo=now_bolivia,
+                extra_fields={"particion_campo": partition_field, "particion": particion},
+                db=db
+            )
+            segments[str(particion)] = df_rfm_segments["Segmento_Nombre"].value_counts().to_dict()
+            records_saved += len(df_rfm_segments)
+
+    save_version_metadata(
+        db,
+        version_id,
+        fecha_calculo=now_bolivia,
+        config={"engine": "kmeans", "num_clusters": NUM_CLUSTERS, "partition_field": partition_field},
+        segments=segments,
+        skipped_partitions=skipped,
+        records=records_saved,
+        stages=profiler.stages
+    )
+    publish_version(db, version_id)
+
+    return {
+        "success": True,
+        "version_id": version_id,
+        "partition_field": partition_field,
+        "partitions": len(partitions),
+        "skipped_partitions": skipped,
+        "segments": segments,
+        "records_processed": len(rfm_data),
+        "records_saved": records_saved,
+        "stages": profiler.stages,
         "timestamp": now_bolivia.isoformat()
     }
 
 def get_customer_segment(customer_id):
     """
-    Obtiene el segmento de un cliente específico.
+    Obtiene el segmento de un cliente específico en la última versión.
     """
     db = get_db()
 
-    # Buscar por cliente_id (string o ObjectId)
-    segment = db.customer_segments.find_one({"cliente_id": customer_id}) or \
-              (ObjectId.is_valid(customer_id) and db.customer_segments.find_one({"cliente_id": ObjectId(customer_id)}))
+    version_id = get_latest_version_id(db)
+    if not version_id:
+        return None
+
+    cliente_id = canonical_cliente_id(customer_id)
+    segment = db.customer_segments.find_one({
+        "version_id": version_id,
+        "cliente_id": {"$in": cliente_id_lookup_values(db, version_id, [cliente_id])}
+    })
 
     if segment and "_id" in segment:
         segment["_id"] = str(segment["_id"])
+        segment["cliente_id"] = canonical_cliente_id(segment.get("cliente_id"))
 
     return segment
+
+def get_customer_segments(customer_ids, chunk_size=BULK_LOOKUP_CHUNK_SIZE):
+    """
+    Obtiene el segmento de muchos clientes en la última versión con consultas
+    $in indexadas por (version_id, cliente_id), en bloques de chunk_size ids.
+    Devuelve (dict cliente_id -> segmento, lista de ids no encontrados).
+    """
+    db = get_db()
+
+    # Normalizar a la forma canónica (acepta ObjectId o {"$oid": ...}) y quitar duplicados
+    ids = [canonical_cliente_id(customer_id) for customer_id in customer_ids]
+    ids = list(dict.fromkeys(c for c in ids if c is not None))
+
+    version_id = get_latest_version_id(db)
+    if not version_id:
+        return {}, ids
+
+    segments = {}
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        cursor = db.customer_segments.find(
+            {"version_id": version_id, "cliente_id": {"$in": cliente_id_lookup_values(db, version_id, chunk)}},
+            projection={"_id": 0, "cliente_id": 1, "segmento": 1}
+        )
+        for doc in cursor:
+            segments[str(doc["cliente_id"])] = doc.get("segmento")
+
+    not_found = [c for c in ids if c not in segments]
+    return segments, not_found
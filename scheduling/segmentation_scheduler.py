@@ -0,0 +1,175 @@
+import atexit
+import logging
+import os
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from apscheduler.schedulers.background import BackgroundScheduler
+from dotenv import load_dotenv
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from db.mongo import get_db
+from models.model_persistence import get_latest_version
+from rfm_analysis import count_new_sales, NEW_SALES_THRESHOLD
+from worker.segmentation_worker import execute_segmentation
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Parámetros del scheduler
+SCHEDULER_ENABLED = os.getenv('SCHEDULER_ENABLED', 'False') == 'True'
+SCHEDULER_INTERVAL_SECONDS = int(os.getenv('SCHEDULER_INTERVAL_SECONDS', 300))
+SCHEDULER_LEASE_SECONDS = int(os.getenv('SCHEDULER_LEASE_SECONDS', 3 * SCHEDULER_INTERVAL_SECONDS))
+MAX_MODEL_AGE_HOURS = float(os.getenv('MAX_MODEL_AGE_HOURS', 24 * 7))
+RETRAIN_DEBOUNCE_MINUTES = float(os.getenv('RETRAIN_DEBOUNCE_MINUTES', 30))
+
+LOCK_ID = "segmentation_scheduler"
+
+# Identificador único de este proceso (cada worker de gunicorn tiene el suyo)
+OWNER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_scheduler = None
+
+
+def acquire_leadership(db, owner_id=OWNER_ID, lease_seconds=SCHEDULER_LEASE_SECONDS):
+    """
+    Intenta tomar (o renovar) el lease de líder en scheduler_locks.
+    Solo un proceso puede tenerlo mientras no haya expirado.
+    """
+    now = datetime.utcnow()
+    try:
+        lock = db.scheduler_locks.find_one_and_update(
+            {"_id": LOCK_ID, "$or": [{"owner": owner_id}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": owner_id, "expires_at": now + timedelta(seconds=lease_seconds)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # El documento existe y otro proceso tiene un lease vigente
+        return None
+    return lock
+
+
+def release_leadership(db, owner_id=OWNER_ID):
+    db.scheduler_locks.update_one(
+        {"_id": LOCK_ID, "owner": owner_id},
+        {"$set": {"expires_at": datetime.utcnow()}}
+    )
+
+
+@contextmanager
+def lease_heartbeat(db, owner_id=OWNER_ID, lease_seconds=SCHEDULER_LEASE_SECONDS):
+    """
+    Renueva el lease en un hilo cada lease_seconds/3 mientras dura el bloque,
+    para que una segmentación más larga que el lease no deje que otro proceso
+    tome el liderazgo y lance una segunda a la vez.
+    """
+    stop = threading.Event()
+
+    def renew():
+        while not stop.wait(lease_seconds / 3):
+            try:
+                if not acquire_leadership(db, owner_id, lease_seconds):
+                    logger.warning(f"Scheduler ({owner_id}) perdió el lease durante la segmentación")
+            except Exception as e:
+                logger.error(f"Error renovando el lease del scheduler: {str(e)}")
+
+    thread = threading.Thread(target=renew, name="scheduler-lease-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def evaluate_retraining(db):
+    """
+    Decide si hay que reentrenar: por ventas nuevas sobre el umbral o por
+    antigüedad del último modelo. Devuelve el motivo o None.
+    """
+    last_seg = get_latest_version(db)
+    if not last_seg:
+        return "sin segmentación previa"
+
+    last_date = last_seg["fecha_calculo"]
+    nuevas_ventas = count_new_sales(db, last_date)
+    if nuevas_ventas >= NEW_SALES_THRESHOLD:
+        return f"{nuevas_ventas} ventas nuevas"
+
+    age = datetime.utcnow() - last_date.replace(tzinfo=None)
+    if age > timedelta(hours=MAX_MODEL_AGE_HOURS):
+        return f"modelo con {age.total_seconds() / 3600:.1f} horas de antigüedad"
+
+    return None
+
+
+def scheduled_segmentation():
+    """
+    Tarea periódica: solo el líder evalúa los umbrales y lanza la segmentación.
+    """
+    try:
+        db = get_db()
+        lock = acquire_leadership(db)
+        if not lock:
+            return
+
+        last_triggered = lock.get("last_triggered")
+        if last_triggered and datetime.utcnow() - last_triggered < timedelta(minutes=RETRAIN_DEBOUNCE_MINUTES):
+            return
+
+        reason = evaluate_retraining(db)
+        if not reason:
+            return
+
+        # Registrar el disparo antes de entrenar para que ningún otro líder lo repita
+        db.scheduler_locks.update_one(
+            {"_id": LOCK_ID, "owner": OWNER_ID},
+            {"$set": {"last_triggered": datetime.utcnow(), "last_reason": reason}}
+        )
+        logger.info(f"Scheduler ({OWNER_ID}) lanza segmentación: {reason}")
+        with lease_heartbeat(db):
+            result = execute_segmentation(force=True)
+        logger.info(f"Segmentación programada finalizada: {result.get('segments')}")
+    except Exception as e:
+        logger.error(f"Error en segmentación programada: {str(e)}")
+
+
+def start_scheduler():
+    """
+    Arranca el scheduler en segundo plano (una vez por proceso).
+    """
+    global _scheduler
+    if _scheduler is not None:
+        return _scheduler
+
+    _scheduler = BackgroundScheduler(timezone="America/La_Paz")
+    _scheduler.add_job(
+        scheduled_segmentation,
+        "interval",
+        seconds=SCHEDULER_INTERVAL_SECONDS,
+        id=LOCK_ID,
+        max_instances=1,
+        coalesce=True,
+        next_run_time=datetime.now()
+    )
+    _scheduler.start()
+    atexit.register(stop_scheduler)
+    logger.info(f"Scheduler de segmentación iniciado ({OWNER_ID}, cada {SCHEDULER_INTERVAL_SECONDS}s)")
+    return _scheduler
+
+
+def stop_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        return
+    _scheduler.shutdown(wait=False)
+    _scheduler = None
+    try:
+        release_leadership(get_db())
+    except Exception as e:
+        logger.error(f"Error liberando el lease del scheduler: {str(e)}")
@@ -0,0 +1,65 @@
+"""
+Benchmark de la extracción RFM: agregación única frente a rangos de cliente en
+paralelo, con varios tamaños de datos sintéticos en un MongoDB local.
+
+Uso:
+    python test/bench_extraction.py --sizes 100000,1000000 --parallelism 2,4,8
+"""
+import argparse
+import os
+import sys
+import time
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(TEST_DIR))
+sys.path.append(TEST_DIR)
+
+
+def best_time(fn, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de extracción RFM")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default="rfm_bench")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Número de ventas por prueba")
+    parser.add_argument("--clientes-ratio", type=float, default=0.05, help="Clientes por venta")
+    parser.add_argument("--parallelism", default="2,4,8")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # db.mongo lee la conexión al importarse
+    os.environ["MONGO_URI"] = args.mongo_uri
+    os.environ["DB_NAME"] = args.db_name
+    from db.mongo import get_db
+    from data.rfm_extractor import extract_rfm_data, extract_rfm_data_parallel
+    from loadtest import seed_database
+
+    db = get_db()
+    levels = [int(p) for p in args.parallelism.split(",")]
+
+    print(f"{'ventas':>10}{'clientes':>10}{'modo':>12}{'segundos':>10}{'speedup':>9}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        n_clientes = max(1, int(size * args.clientes_ratio))
+        seed_database(db, n_clientes, size)
+
+        base, base_rows = best_time(extract_rfm_data, args.repeat)
+        print(f"{size:>10}{len(base_rows):>10}{'único':>12}{base:>10.3f}{1:>9.2f}")
+
+        for n in levels:
+            elapsed, rows = best_time(lambda: extract_rfm_data_parallel(n), args.repeat)
+            if len(rows) != len(base_rows):
+                print(f"⚠️ {n} rangos devolvieron {len(rows)} filas en lugar de {len(base_rows)}")
+            print(f"{size:>10}{len(rows):>10}{f'{n} rangos':>12}{elapsed:>10.3f}{base / elapsed:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
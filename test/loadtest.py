@@ -0,0 +1,290 @@
+"""
+Prueba de carga: levanta la app con gunicorn contra un MongoDB local con datos
+sintéticos, reproduce una mezcla de tráfico y reporta throughput y latencias
+(p50/p90/p99) por endpoint y por configuración de workers/threads.
+
+Uso:
+    python test/loadtest.py --seed --configs 2x4,5x2,8x1 --duration 30
+    python test/loadtest.py --log requests.jsonl --concurrency 32
+
+El log (--log) es un JSONL con una petición por línea:
+    {"method": "GET", "path": "/api/segmentation/status"}
+    {"method": "POST", "path": "/api/customer/segments", "body": {"ids": ["..."]}}
+Las líneas sin "path" se ignoran. Sin log se usa la mezcla de --mix.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pymongo
+from bson import ObjectId
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+from models.model_persistence import ensure_indexes
+
+ESTADOS = ["Procesado", "Completado", "Entregado", "Pendiente", "Cancelado"]
+
+# Mezcla por defecto: endpoint -> peso
+DEFAULT_MIX = {
+    "customer_segment": 80,
+    "status": 10,
+    "clientes_detalles": 9,
+    "run": 1,
+}
+
+
+def seed_database(db, n_clientes, n_ventas, seed=42):
+    """
+    Reemplaza clientes, ventas y customer_segments por datos sintéticos y crea
+    los mismos índices que el despliegue (ensure_indexes.py).
+    Devuelve la lista de ids de clientes (string).
+    """
+    rng = random.Random(seed)
+    for name in ("clientes", "ventas", "customer_segments", "segmentation_versions"):
+        db[name].drop()
+
+    cliente_ids = [ObjectId() for _ in range(n_clientes)]
+    db.clientes.insert_many(
+        [{"_id": cid, "fullname": f"Cliente {i}"} for i, cid in enumerate(cliente_ids)]
+    )
+
+    ahora = datetime.utcnow()
+    batch = []
+    for _ in range(n_ventas):
+        batch.append({
+            "cliente": rng.choice(cliente_ids),
+            "total": round(rng.lognormvariate(4, 1), 2),
+            "createdAT": ahora - timedelta(days=rng.expovariate(1 / 90)),
+            "estado": rng.choices(ESTADOS, weights=[30, 40, 20, 5, 5])[0],
+        })
+        if len(batch) == 10000:
+            db.ventas.insert_many(batch)
+            batch = []
+    if batch:
+        db.ventas.insert_many(batch)
+
+    db.ventas.create_index([("estado", 1), ("createdAT", 1)])
+    db.ventas.create_index("cliente")
+    ensure_indexes(db)
+    return [str(cid) for cid in cliente_ids]
+
+
+def load_request_log(path):
+    requests = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if "path" in entry:
+                requests.append((entry.get("method", "GET"), entry["path"], entry.get("body")))
+    return requests
+
+
+def build_request(kind, cliente_ids, rng):
+    if kind == "customer_segment":
+        return "GET", f"/api/customer/segment/{rng.choice(cliente_ids)}", None
+    if kind == "status":
+        return "GET", "/api/segmentation/status", None
+    if kind == "clientes_detalles":
+        page = rng.randint(1, max(1, len(cliente_ids) // 100))
+        return "GET", f"/api/clientes/detalles?page={page}&limit=100", None
+    if kind == "run":
+        return "POST", "/api/segmentation/run", None
+    raise ValueError(f"Tipo de petición desconocido: {kind}")
+
+
+def endpoint_label(method, path):
+    # Agrupar rutas con ids y quitar query string
+    path = path.split("?", 1)[0]
+    path = re.sub(r"/[0-9a-f]{24}(?=/|$)", "/<id>", path)
+    return f"{method} {path}"
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def wait_for_server(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            conn.request("GET", "/api/health")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError("El servidor no respondió a tiempo")
+
+
+def start_server(workers, threads, port, env):
+    cmd = [
+        sys.executable, "-m", "gunicorn",
+        "-c", "gunicorn_config.py",
+        "-w", str(workers),
+        "--threads", str(threads),
+        "-b", f"127.0.0.1:{port}",
+        "wsgi:app",
+    ]
+    return subprocess.Popen(cmd, cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+
+
+def send(conn, method, path, body):
+    headers = {}
+    payload = None
+    if body is not None:
+        payload = json.dumps(body)
+        headers["Content-Type"] = "application/json"
+    conn.request(method, path, body=payload, headers=headers)
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+
+def run_load(port, next_request, concurrency, duration):
+    """
+    Lanza `concurrency` clientes con conexión keep-alive que envían peticiones
+    durante `duration` segundos. Devuelve {endpoint: [(latencia, status), ...]}.
+    """
+    results = defaultdict(list)
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(worker_id):
+        rng = random.Random(worker_id)
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+        local = defaultdict(list)
+        while time.monotonic() < deadline:
+            method, path, body = next_request(rng)
+            start = time.perf_counter()
+            try:
+                status = send(conn, method, path, body)
+            except (OSError, http.client.HTTPException):
+                status = 0
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+            local[endpoint_label(method, path)].append((time.perf_counter() - start, status))
+        conn.close()
+        with lock:
+            for label, samples in local.items():
+                results[label].extend(samples)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def summarize(results, duration):
+    summary = {}
+    for label, samples in sorted(results.items()):
+        latencies = sorted(latency for latency, _ in samples)
+        errors = sum(1 for _, status in samples if status == 0 or status >= 500)
+        summary[label] = {
+            "requests": len(samples),
+            "rps": len(samples) / duration,
+            "errors": errors,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p90_ms": percentile(latencies, 90) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+        }
+    total = sum(len(samples) for samples in results.values())
+    return {"total_requests": total, "total_rps": total / duration, "endpoints": summary}
+
+
+def print_summary(config, summary):
+    print(f"\n=== {config}: {summary['total_requests']} peticiones, {summary['total_rps']:.1f} req/s ===")
+    print(f"{'endpoint':<45}{'req':>8}{'req/s':>9}{'err':>6}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+    for label, row in summary["endpoints"].items():
+        print(f"{label:<45}{row['requests']:>8}{row['rps']:>9.1f}{row['errors']:>6}"
+              f"{row['p50_ms']:>10.1f}{row['p90_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        kind, weight = part.split("=")
+        mix[kind.strip()] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API de segmentación")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db-name", default="rfm_loadtest")
+    parser.add_argument("--seed", action="store_true", help="Regenerar los datos sintéticos")
+    parser.add_argument("--clientes", type=int, default=10000)
+    parser.add_argument("--ventas", type=int, default=200000)
+    parser.add_argument("--configs", default="5x2", help="Configuraciones workersxthreads separadas por coma")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="Pesos, p. ej. customer_segment=80,status=10,clientes_detalles=9,run=1")
+    parser.add_argument("--log", help="Log JSONL de peticiones a reproducir en lugar de la mezcla")
+    parser.add_argument("--output", help="Guardar el resumen en JSON")
+    args = parser.parse_args()
+
+    db = pymongo.MongoClient(args.mongo_uri)[args.db_name]
+    if args.seed or db.clientes.estimated_document_count() == 0:
+        print(f"Generando {args.clientes} clientes y {args.ventas} ventas sintéticas...")
+        cliente_ids = seed_database(db, args.clientes, args.ventas)
+    else:
+        cliente_ids = [str(c["_id"]) for c in db.clientes.find({}, {"_id": 1})]
+
+    if args.log:
+        logged = load_request_log(args.log)
+        if not logged:
+            parser.error(f"El log {args.log} no contiene peticiones")
+        next_request = lambda rng: rng.choice(logged)
+    else:
+        kinds, weights = zip(*args.mix.items())
+        next_request = lambda rng: build_request(rng.choices(kinds, weights=weights)[0], cliente_ids, rng)
+
+    env = dict(os.environ, MONGO_URI=args.mongo_uri, DB_NAME=args.db_name, SCHEDULER_ENABLED="False")
+
+    report = {}
+    for config in args.configs.split(","):
+        workers, threads = (int(v) for v in config.lower().split("x"))
+        server = start_server(workers, threads, args.port, env)
+        try:
+            wait_for_server(args.port)
+            # Asegurar que existe una segmentación antes de medir
+            conn = http.client.HTTPConnection("127.0.0.1", args.port, timeout=600)
+            send(conn, "POST", "/api/segmentation/run?force=true", None)
+            conn.close()
+
+            results = run_load(args.port, next_request, args.concurrency, args.duration)
+            summary = summarize(results, args.duration)
+            report[f"{workers}x{threads}"] = summary
+            print_summary(f"workers={workers} threads={threads}", summary)
+        finally:
+            server.terminate()
+            server.wait()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
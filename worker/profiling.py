@@ -0,0 +1,59 @@
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """
+    Pico de memoria residente del proceso actual en MB (None si no se puede medir).
+    """
+    if resource is None:
+        return None
+    # En Linux ru_maxrss viene en KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class StageProfiler:
+    """
+    Registra tiempo de CPU, tiempo real y pico de RSS al terminar cada etapa.
+    Si tracemalloc está activo, también el pico de memoria trazada de la etapa
+    y las tracemalloc_top líneas con más memoria viva al cerrarla (cuando los
+    DataFrames de la etapa todavía existen).
+    """
+
+    def __init__(self, tracemalloc_top=0):
+        self.stages = []
+        self.tracemalloc_top = tracemalloc_top
+
+    @contextmanager
+    def stage(self, name):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats = {
+                "etapa": name,
+                "cpu_s": time.process_time() - cpu_start,
+                "wall_s": time.perf_counter() - wall_start,
+                "peak_rss_mb": peak_rss_mb()
+            }
+            if tracing:
+                _, peak = tracemalloc.get_traced_memory()
+                stats["tracemalloc_peak_mb"] = peak / (1024 * 1024)
+                if self.tracemalloc_top:
+                    snapshot = tracemalloc.take_snapshot()
+                    stats["tracemalloc_top"] = [{
+                        "ubicacion": str(stat.traceback),
+                        "kb": stat.size / 1024,
+                        "bloques": stat.count
+                    } for stat in snapshot.statistics("lineno")[:self.tracemalloc_top]]
+            self.stages.append(stats)
@@ -0,0 +1,108 @@
+import logging
+import multiprocessing
+import os
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from dotenv import load_dotenv
+
+from db.mongo import get_db
+from models.version_metadata import save_version_metadata
+from rfm_analysis import run_segmentation, run_partitioned_segmentation, check_insufficient_new_data
+from worker.profiling import StageProfiler, peak_rss_mb, resource
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Ejecutar las segmentaciones en un proceso aparte en lugar del worker web
+SEGMENTATION_ISOLATED = os.getenv('SEGMENTATION_ISOLATED', 'True') == 'True'
+
+# Límite de memoria (RLIMIT_AS) del proceso de segmentación en MB (0 = sin límite)
+SEGMENTATION_MEMORY_LIMIT_MB = int(os.getenv('SEGMENTATION_MEMORY_LIMIT_MB', 0))
+
+# Registrar por etapa con tracemalloc las líneas que más memoria ocupan (0 = desactivado).
+# Es opcional porque tracemalloc ralentiza bastante el entrenamiento.
+SEGMENTATION_TRACEMALLOC_TOP = int(os.getenv('SEGMENTATION_TRACEMALLOC_TOP', 0))
+
+
+def _init_worker(memory_limit_mb):
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    if memory_limit_mb and resource is not None:
+        limit = memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _run_in_worker(partition_field, kwargs, tracemalloc_top, memory_limit_mb):
+    """
+    Se ejecuta en el proceso aislado: corre la segmentación (que escribe la
+    versión en MongoDB) y guarda con la versión el consumo de recursos.
+    """
+    if tracemalloc_top:
+        tracemalloc.start()
+    cpu_start = time.process_time()
+    profiler = StageProfiler(tracemalloc_top=tracemalloc_top)
+
+    if partition_field:
+        result = run_partitioned_segmentation(partition_field=partition_field, profiler=profiler, **kwargs)
+    else:
+        result = run_segmentation(profiler=profiler, **kwargs)
+
+    resources = {
+        "pid": os.getpid(),
+        "cpu_s": time.process_time() - cpu_start,
+        "peak_rss_mb": peak_rss_mb(),
+        "memory_limit_mb": memory_limit_mb or None
+    }
+    if tracemalloc_top:
+        # Las líneas con más memoria se guardan por etapa en "stages"
+        _, peak = tracemalloc.get_traced_memory()
+        resources["tracemalloc_peak_mb"] = peak / (1024 * 1024)
+        tracemalloc.stop()
+
+    if result.get("version_id") and not result.get("cache_hit"):
+        save_version_metadata(get_db(), result["version_id"], resources=resources)
+    result["resources"] = resources
+    return result
+
+
+def run_segmentation_isolated(partition_field=None, memory_limit_mb=SEGMENTATION_MEMORY_LIMIT_MB,
+                              tracemalloc_top=SEGMENTATION_TRACEMALLOC_TOP, **kwargs):
+    """
+    Ejecuta run_segmentation (o run_partitioned_segmentation si se indica
+    partition_field) en un proceso nuevo con límite de memoria. El proceso
+    termina al acabar, así que la memoria de pandas/sklearn vuelve al sistema
+    y el worker web no crece. La versión se escribe en MongoDB desde el proceso
+    hijo; al padre solo vuelve el resumen.
+    """
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context,
+                             initializer=_init_worker, initargs=(memory_limit_mb,)) as executor:
+        future = executor.submit(_run_in_worker, partition_field, kwargs, tracemalloc_top, memory_limit_mb)
+        try:
+            return future.result()
+        except MemoryError:
+            logger.error(f"La segmentación superó el límite de memoria ({memory_limit_mb} MB)")
+            return {"success": False, "error": f"Límite de memoria excedido ({memory_limit_mb} MB)"}
+        except BrokenProcessPool:
+            logger.error("El proceso de segmentación terminó de forma inesperada")
+            return {"success": False, "error": "El proceso de segmentación terminó de forma inesperada"}
+
+
+def execute_segmentation(partition_field=None, **kwargs):
+    """
+    Punto de entrada de la API y del scheduler: ejecuta la segmentación en un
+    proceso aislado si SEGMENTATION_ISOLATED, o en el proceso actual si no.
+    """
+    if SEGMENTATION_ISOLATED:
+        # Comprobar el umbral de ventas nuevas aquí (un count_documents) para no
+        # arrancar un intérprete con pandas/sklearn solo para responder que no hay datos
+        if not kwargs.get("force"):
+            insufficient = check_insufficient_new_data(get_db(), partition_field)
+            if insufficient:
+                return insufficient
+        return run_segmentation_isolated(partition_field=partition_field, **kwargs)
+    if partition_field:
+        return run_partitioned_segmentation(partition_field=partition_field, **kwargs)
+    return run_segmentation(**kwargs)